@@ -7,7 +7,11 @@ import html
 import re
 import os
 import truststore
-from helpers import safe_html, format_custom_acceptance_criteria, build_resource_lookup
+import argparse
+from helpers import safe_html, format_custom_acceptance_criteria, get_data_layer_lookups
+from scheduler import REQUESTS_PER_WORK_ITEM, get_run_budget, schedule_work_items, submit_work_items, print_remaining_report
+from watch import watch_directory
+from metadata import validate_ado_targets
 
 from templates import (
     build_description_html,
@@ -32,6 +36,29 @@ ORG_URL = os.getenv("ORG_URL")
 PROJECT = "Design"  # The project you're targeting
 API_VERSION = "6.0"  # Update to a newer version for better support
 
+# Work item settings for the PBIs we create
+WORK_ITEM_TYPE = "Product Backlog Item"
+ITERATION_PATH = "Design\\Accessibility"
+AREA_PATH = "Design\\Accessibility"
+
+# Fields set on every PBI, checked against the work item type before creating any PBIs
+PBI_FIELDS = [
+    "System.Title",
+    "System.Description",
+    "Microsoft.VSTS.Common.AcceptanceCriteria",
+    "Microsoft.VSTS.Common.Priority",
+    "System.IterationPath",
+    "System.AreaPath",
+    "System.Tags"
+]
+
+# Shared HTTP session so connections to ADO are reused across requests (and across files in watch mode)
+SESSION = requests.Session()
+
+# Optional run budget, so the most important PBIs are filed first within our API quota
+RUN_TIME_BUDGET_SECONDS = get_run_budget("RUN_TIME_BUDGET_SECONDS", float)  # Wall-clock budget per run
+RUN_REQUEST_BUDGET = get_run_budget("RUN_REQUEST_BUDGET", int)  # Maximum number of ADO requests per run
+
 # Function to create a PBI
 def create_pbi(title, description, acceptance_criteria, priority, tags, pat):
     url = f"{ORG_URL}/{PROJECT}/_apis/wit/workitems/$Product%20Backlog%20Item?api-version={API_VERSION}"
@@ -46,14 +73,14 @@ def create_pbi(title, description, acceptance_criteria, priority, tags, pat):
         {"op": "add", "path": "/fields/System.Description", "value": description},
         {"op": "add", "path": "/fields/Microsoft.VSTS.Common.AcceptanceCriteria", "value": acceptance_criteria},
         {"op": "add", "path": "/fields/Microsoft.VSTS.Common.Priority", "value": priority},
-        {"op": "add", "path": "/fields/System.IterationPath", "value": "Design\\Accessibility"},
-        {"op": "add", "path": "/fields/System.AreaPath", "value": "Design\\Accessibility"},
+        {"op": "add", "path": "/fields/System.IterationPath", "value": ITERATION_PATH},
+        {"op": "add", "path": "/fields/System.AreaPath", "value": AREA_PATH},
         {"op": "add", "path": "/fields/System.Tags", "value": tags}
     ]
 
     try:
         # Send the request to create the work item
-        response = requests.post(url, headers=headers, data=json.dumps(body), auth=HTTPBasicAuth('', pat))
+        response = SESSION.post(url, headers=headers, data=json.dumps(body), auth=HTTPBasicAuth('', pat))
 
         if response.status_code in (200, 201):
             print(f"Successfully created PBI: {response.json()['id']} at {response.json()['_links']['html']['href']}\n")
@@ -82,7 +109,7 @@ def link_pbi_to_feature(pbi_id, feature_id, pat):
         }
     ]
 
-    response = requests.patch(url, headers={"Content-Type": "application/json-patch+json"}, data=json.dumps(relation_body), auth=HTTPBasicAuth('', pat))
+    response = SESSION.patch(url, headers={"Content-Type": "application/json-patch+json"}, data=json.dumps(relation_body), auth=HTTPBasicAuth('', pat))
 
     if response.status_code in (200, 204):
         pass
@@ -114,14 +141,35 @@ def write_pbi_url_to_excel(workbook, summary_sheet, row_index, pbi_url):
     else:
         print("ERROR: 'Remediation PBI' column not found in the sheet.")
 
+# Function to create the PBI for a work item and link it to the Parent Feature
+def submit_work_item(work_item, feature_id, pat):
+    if work_item["group"] is not None:
+        print(f"Creating grouped PBI for group {work_item['group']} at row(s) {', '.join(str(r) for r in work_item['rows'])}...")
+
+    pbi_id = create_pbi(
+        work_item["title"],
+        work_item["description"],
+        work_item["acceptance_criteria"],
+        work_item["priority"],
+        work_item["tags"],
+        pat
+    )
+    if not pbi_id:
+        return None
+
+    # Link to parent feature (only once per group)
+    link_pbi_to_feature(pbi_id, feature_id, pat)
+    return f"{ORG_URL}/_workitems/edit/{pbi_id}"
+
 # Main function to read the Excel file and create PBIs
+# Returns True when some work items were left unfiled (run budget reached or creates failed)
 def create_pbis_from_excel(excel_path, pat):
     try:
         # Open the workbook and sheets
         workbook = openpyxl.load_workbook(excel_path, data_only=True)
         report_details_sheet = workbook['Report Details']
         summary_sheet = workbook['Evaluation']
-        resource_lookup = build_resource_lookup(workbook)
+        resource_lookup, acceptance_criteria_lookup = get_data_layer_lookups(workbook, excel_path)
         
         # Extract information from the 'Report Details' sheet
         page_name = report_details_sheet.cell(row=6, column=2).value
@@ -161,56 +209,6 @@ def create_pbis_from_excel(excel_path, pat):
 
         # Get the column index of the 'Resources, Screen Captures, Links' column
         resources_column_index = summary.columns.get_loc('Resources, Screen Captures, Links') + 1  # +1 for openpyxl index
-    
-        # 1) Load the whole DataLayer sheet into memory
-        data_layer_sheet = pd.read_excel(
-            excel_path,
-            sheet_name="DataLayer",
-            engine="openpyxl",
-            dtype=str
-        )
-        # 2) Clean up the Acceptance Criteria column and drop truly empty rows
-        data_layer_sheet["Acceptance Criteria"] = (
-            data_layer_sheet["Acceptance Criteria"]
-            .fillna("")       # replace NaN with empty string
-            .str.strip()      # trim whitespace
-        )
-        # Keep only rows that actually have AC text
-        rows_with_custom_acceptance_criteria = data_layer_sheet[
-            data_layer_sheet["Acceptance Criteria"] != ""
-        ]
-
-        # 3) Build a lookup so we can quickly find AC by (Notes, Remediation) key
-        #    Now we also store an optional "AC Reference Link" if present.
-        acceptance_criteria_lookup: dict[tuple[str, str], dict] = {}
-        for _, row in rows_with_custom_acceptance_criteria.iterrows():
-            notes_key       = str(row["Notes"]).strip()
-            remediation_key = str(row["Remediation Techniques"]).strip()
-
-            # pull the custom AC text itself
-            acceptance_criteria_text = row.get("Acceptance Criteria", "").strip()
-
-            # read your two new columns
-            ac_reference_link = row.get("AC Reference Link (full or minified URL)")
-            ac_reference_name = row.get("AC Reference Name (friendly text)")
-
-            # normalize link
-            if pd.notna(ac_reference_link):
-                ac_reference_link = ac_reference_link.strip()
-            else:
-                ac_reference_link = None
-
-            # normalize friendly text
-            if pd.notna(ac_reference_name):
-                ac_reference_name = ac_reference_name.strip()
-            else:
-                ac_reference_name = None
-
-            acceptance_criteria_lookup[(notes_key, remediation_key)] = {
-                "text":            acceptance_criteria_text,
-                "reference_link":  ac_reference_link,
-                "reference_name":  ac_reference_name
-            }
 
         # Pre-aggregate remediation techniques for grouped rows
         grouped_data = {}
@@ -264,13 +262,16 @@ def create_pbis_from_excel(excel_path, pat):
                         "acceptance_criteria_name": acceptance_criteria_name
                     })
         
-        # Dictionary to store created PBI URL for each group
-        group_pbi_map = {}
+        # List of pending work items, one per PBI to create (grouped rows share a single work item)
+        work_items = []
+
+        # Dictionary to find the work item for each group
+        group_work_item_map = {}
 
         # List to hold PBI URLs for writing after PBIs are created
         pbi_urls = []
 
-        # Loop through each row in the DataFrame and create PBIs
+        # Loop through each row in the DataFrame and build the pending work items
         for index, row in summary.iterrows():
             # Skip rows that have a value in the 'Remediation PBI' column
             if pd.notna(row.get('Remediation PBI')):
@@ -285,6 +286,11 @@ def create_pbis_from_excel(excel_path, pat):
             # Determine if this row is part of a group
             group_val = row.get("Group")
 
+            # Already have a work item for this group; this row will reuse its PBI
+            if pd.notna(group_val) and group_val in group_work_item_map:
+                group_work_item_map[group_val]["rows"].append(index + 2)
+                continue
+
             # Map the columns to the corresponding PBI fields
             title = f"Remediation - {page_name} - "  # Limiting title to 50 characters
 
@@ -413,44 +419,77 @@ def create_pbis_from_excel(excel_path, pat):
             priority = map_priority(row['Priority'])
             tags = f"Remediation,Accessibility,{page_name} Page"
 
-            # Process grouped rows differently
+            work_item = {
+                "rows": [index + 2],
+                "group": group_val if pd.notna(group_val) else None,
+                "title": title,
+                "description": description,
+                "acceptance_criteria": acceptance_criteria,
+                "priority": priority,
+                "tags": tags
+            }
+            work_items.append(work_item)
             if pd.notna(group_val):
-                if group_val in group_pbi_map:
-                    # Already created a PBI for this group; reuse its URL
-                    pbi_url = group_pbi_map[group_val]
-                    print(f"Using existing PBI for group {group_val} at row {index+2}")
-                else:
-                    print(f"Creating grouped PBI for group {group_val} at row {index+2}...")
-                    pbi_id = create_pbi(title, description, acceptance_criteria, priority, tags, pat)
-                    if pbi_id:
-                        pbi_url = f"{ORG_URL}/_workitems/edit/{pbi_id}"
-                        group_pbi_map[group_val] = pbi_url  # Store for later reuse
-                        # Link to parent feature (only once per group)
-                        link_pbi_to_feature(pbi_id, feature_id, pat)
-                    else:
-                        pbi_url = None
-                if pbi_url:
-                    pbi_urls.append((index + 2, pbi_url))
-                else:
-                    print(f"ERROR: Failed to create PBI for grouped row {index+2}.")
-            else:
-                # Process non-grouped row normally
-                pbi_id = create_pbi(title, description, acceptance_criteria, priority, tags, pat)
-                if pbi_id:
-                    pbi_url = f"{ORG_URL}/_workitems/edit/{pbi_id}"
-                    pbi_urls.append((index + 2, pbi_url))
-                    link_pbi_to_feature(pbi_id, feature_id, pat)
+                group_work_item_map[group_val] = work_item
+
+        # Check the parent feature, paths and PBI fields once before submitting rather than failing on every row.
+        # Skipped when nothing is pending, so re-runs on a fully filed workbook make no ADO requests.
+        metadata_requests = 0
+        if work_items:
+            metadata_errors, metadata_requests = validate_ado_targets(
+                SESSION, ORG_URL, PROJECT, API_VERSION, pat,
+                str(feature_id).strip(), ITERATION_PATH, AREA_PATH, WORK_ITEM_TYPE, PBI_FIELDS
+            )
+            if metadata_errors:
+                for message in metadata_errors:
+                    print(f"ERROR: {message}")
+                print("Exiting script early — no PBIs were created.\n")
+                return
+
+        # The metadata lookups above count against the request budget too
+        request_budget = RUN_REQUEST_BUDGET - metadata_requests if RUN_REQUEST_BUDGET is not None else None
+
+        if request_budget is not None and request_budget < REQUESTS_PER_WORK_ITEM:
+            print(f"\nBUDGET: Validating ADO metadata used {metadata_requests} of the {RUN_REQUEST_BUDGET} request budget, leaving none for PBIs.")
+            completed, remaining = [], schedule_work_items(work_items)
+        else:
+            # Submit the most important work items first, stopping cleanly if the run budget is spent
+            completed, remaining = submit_work_items(
+                schedule_work_items(work_items),
+                lambda work_item: submit_work_item(work_item, feature_id, pat),
+                max_seconds=RUN_TIME_BUDGET_SECONDS,
+                max_requests=request_budget
+            )
+
+        for work_item, pbi_url in completed:
+            if pbi_url:
+                for row_index in work_item["rows"]:
+                    pbi_urls.append((row_index, pbi_url))
+            elif work_item["group"] is not None:
+                print(f"ERROR: Failed to create PBI for grouped row(s) {', '.join(str(r) for r in work_item['rows'])}.")
+
+        print_remaining_report(remaining)
 
         # Now that all PBIs are created, write PBI URLs to the Excel sheet
         for row_index, pbi_url in pbi_urls:
             write_pbi_url_to_excel(workbook, summary_sheet, row_index, pbi_url)
 
-        print("\nUPDATED: All PBI URLs written into Excel file\n")
+        if remaining:
+            print("\nUPDATED: PBI URLs for submitted work items written into Excel file\n")
+        else:
+            print("\nUPDATED: All PBI URLs written into Excel file\n")
 
         # Save the workbook after writing all URLs
         workbook.save(excel_path)
         
-        print("\nSUCCESS: PBI creation complete!")
+        if remaining:
+            print(f"\nPARTIAL: PBI creation stopped at the run budget with {len(remaining)} work item(s) remaining.")
+        else:
+            print("\nSUCCESS: PBI creation complete!")
+
+        # Let callers such as watch mode know whether rows are still waiting for a PBI
+        failed_count = sum(1 for _, pbi_url in completed if not pbi_url)
+        return bool(remaining) or failed_count > 0
     
     except FileNotFoundError:
         print(f"ERROR: File {excel_path} not found. Please check the path and try again.")
@@ -459,28 +498,39 @@ def create_pbis_from_excel(excel_path, pat):
 
 
 if __name__ == "__main__":
-    # Get Personal Access Token from user
-    PAT = input("Please enter your ADO Personal Access Token (PAT): ")
+    parser = argparse.ArgumentParser(description="Create accessibility remediation PBIs from an audit report Excel file.")
+    parser.add_argument("--watch", metavar="DIRECTORY", help="Watch a folder and create PBIs for each new or modified workbook")
+    args = parser.parse_args()
 
-    attempts = 0  # Initialize attempt counter
-    max_attempts = 3  # Set maximum number of attempts
+    # Get Personal Access Token from the environment or the user
+    PAT = os.getenv("ADO_PAT") or input("Please enter your ADO Personal Access Token (PAT): ")
 
-    while attempts < max_attempts:  # Limit attempts to max_attempts
-        # Prompt user for the Excel file path
-        excel_file_path = input("Please enter the path to the Excel file: ")
-
-        # Check if the file exists
-        if os.path.isfile(excel_file_path):
-            # Create PBIs from the Excel file
-            create_pbis_from_excel(excel_file_path, PAT)
-            break  # Exit the loop if the file is valid
+    if args.watch:
+        if not os.path.isdir(args.watch):
+            print(f"ERROR: The folder '{args.watch}' does not exist. Please provide a valid path.")
         else:
-            attempts += 1  # Increment the attempt counter
-            print(f"ERROR: The file '{excel_file_path}' does not exist. Please provide a valid path.")
-
-            # Provide feedback on remaining attempts
-            remaining_attempts = max_attempts - attempts
-            if remaining_attempts > 0:
-                print(f"You have {remaining_attempts} attempt(s) left.")
+            # Keep running, reusing the HTTP session and DataLayer lookups for every workbook
+            watch_directory(args.watch, lambda path: create_pbis_from_excel(path, PAT))
+    else:
+        attempts = 0  # Initialize attempt counter
+        max_attempts = 3  # Set maximum number of attempts
+
+        while attempts < max_attempts:  # Limit attempts to max_attempts
+            # Prompt user for the Excel file path
+            excel_file_path = input("Please enter the path to the Excel file: ")
+
+            # Check if the file exists
+            if os.path.isfile(excel_file_path):
+                # Create PBIs from the Excel file
+                create_pbis_from_excel(excel_file_path, PAT)
+                break  # Exit the loop if the file is valid
             else:
-                print("You have exceeded the maximum number of attempts. Exiting the program.")
+                attempts += 1  # Increment the attempt counter
+                print(f"ERROR: The file '{excel_file_path}' does not exist. Please provide a valid path.")
+
+                # Provide feedback on remaining attempts
+                remaining_attempts = max_attempts - attempts
+                if remaining_attempts > 0:
+                    print(f"You have {remaining_attempts} attempt(s) left.")
+                else:
+                    print("You have exceeded the maximum number of attempts. Exiting the program.")
@@ -75,3 +75,76 @@ def build_resource_lookup(workbook):
             resource_lookup[friendly_text.strip()] = url.strip()
 
     return resource_lookup
+
+def build_acceptance_criteria_lookup(excel_path):
+    # Builds a lookup of custom Acceptance Criteria from the DataLayer sheet, keyed by (Notes, Remediation).
+    # 1) Load the whole DataLayer sheet into memory
+    data_layer_sheet = pd.read_excel(
+        excel_path,
+        sheet_name="DataLayer",
+        engine="openpyxl",
+        dtype=str
+    )
+    # 2) Clean up the Acceptance Criteria column and drop truly empty rows
+    data_layer_sheet["Acceptance Criteria"] = (
+        data_layer_sheet["Acceptance Criteria"]
+        .fillna("")       # replace NaN with empty string
+        .str.strip()      # trim whitespace
+    )
+    # Keep only rows that actually have AC text
+    rows_with_custom_acceptance_criteria = data_layer_sheet[
+        data_layer_sheet["Acceptance Criteria"] != ""
+    ]
+
+    # 3) Build a lookup so we can quickly find AC by (Notes, Remediation) key
+    #    Now we also store an optional "AC Reference Link" if present.
+    acceptance_criteria_lookup: dict[tuple[str, str], dict] = {}
+    for _, row in rows_with_custom_acceptance_criteria.iterrows():
+        notes_key       = str(row["Notes"]).strip()
+        remediation_key = str(row["Remediation Techniques"]).strip()
+
+        # pull the custom AC text itself
+        acceptance_criteria_text = row.get("Acceptance Criteria", "").strip()
+
+        # read your two new columns
+        ac_reference_link = row.get("AC Reference Link (full or minified URL)")
+        ac_reference_name = row.get("AC Reference Name (friendly text)")
+
+        # normalize link
+        if pd.notna(ac_reference_link):
+            ac_reference_link = ac_reference_link.strip()
+        else:
+            ac_reference_link = None
+
+        # normalize friendly text
+        if pd.notna(ac_reference_name):
+            ac_reference_name = ac_reference_name.strip()
+        else:
+            ac_reference_name = None
+
+        acceptance_criteria_lookup[(notes_key, remediation_key)] = {
+            "text":            acceptance_criteria_text,
+            "reference_link":  ac_reference_link,
+            "reference_name":  ac_reference_name
+        }
+
+    return acceptance_criteria_lookup
+
+# Most recent DataLayer lookups, kept warm across workbooks in watch mode: (sheet contents, lookups)
+_data_layer_cache = None
+
+def get_data_layer_lookups(workbook, excel_path):
+    # Returns (resource_lookup, acceptance_criteria_lookup) for the workbook's DataLayer sheet.
+    # Reports share the same DataLayer, so the lookups for the last one seen are reused
+    # instead of re-reading the sheet with pandas for every file.
+    global _data_layer_cache
+    sheet = workbook['DataLayer']
+    cache_key = tuple(sheet.iter_rows(values_only=True))
+
+    if _data_layer_cache is None or _data_layer_cache[0] != cache_key:
+        _data_layer_cache = (
+            cache_key,
+            (build_resource_lookup(workbook), build_acceptance_criteria_lookup(excel_path))
+        )
+
+    return _data_layer_cache[1]
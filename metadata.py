@@ -0,0 +1,186 @@
+import json
+import os
+import time
+from urllib.parse import quote
+from requests.auth import HTTPBasicAuth
+
+# Default location and lifetime of the on-disk metadata cache, shared across runs and workbooks
+DEFAULT_METADATA_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".generate-pbis", "ado_metadata_cache.json")
+DEFAULT_METADATA_CACHE_TTL_SECONDS = 86400  # One day
+
+def get_metadata_cache_path():
+    # Read when used rather than at import time, so values from the .env file are picked up
+    return os.getenv("ADO_METADATA_CACHE_PATH") or DEFAULT_METADATA_CACHE_PATH
+
+def get_metadata_cache_ttl():
+    ttl_text = os.getenv("ADO_METADATA_CACHE_TTL_SECONDS")
+    if not ttl_text:
+        return DEFAULT_METADATA_CACHE_TTL_SECONDS
+    try:
+        return int(ttl_text)
+    except ValueError:
+        print(f"WARNING: ADO_METADATA_CACHE_TTL_SECONDS '{ttl_text}' is not a whole number of seconds, using {DEFAULT_METADATA_CACHE_TTL_SECONDS}.")
+        return DEFAULT_METADATA_CACHE_TTL_SECONDS
+
+def load_metadata_cache():
+    # Reads the cache file, dropping entries that have expired.
+    # A missing, unreadable or corrupt file is treated as an empty cache.
+    try:
+        with open(get_metadata_cache_path(), "r", encoding="utf-8") as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(cache, dict):
+        return {}
+
+    now = time.time()
+    return {
+        key: entry for key, entry in cache.items()
+        if isinstance(entry, dict)
+        and isinstance(entry.get("expires_at"), (int, float))
+        and entry["expires_at"] > now
+    }
+
+def save_metadata_cache(cache):
+    # Writes the cache to a temporary file first so a crash never leaves a half-written cache behind
+    cache_path = get_metadata_cache_path()
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        temp_path = f"{cache_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"WARNING: Could not save the ADO metadata cache: {str(e)}")
+
+# Responses that mean the PAT was rejected; 203 is the sign-in page ADO returns for an invalid PAT
+AUTH_FAILURE_STATUS_CODES = (203, 401, 403)
+
+class AdoAuthenticationError(Exception):
+    pass
+
+def get_json(session, url, pat):
+    # Returns (status_code, json) for a GET request, or (None, None) if the request could not be sent.
+    # json is None when the response isn't a 200 or its body isn't valid JSON.
+    # Raises AdoAuthenticationError if ADO rejects the PAT, since every create would fail the same way.
+    try:
+        response = session.get(url, auth=HTTPBasicAuth('', pat))
+    except Exception as e:
+        print(f"WARNING: Could not reach ADO to validate metadata: {str(e)}")
+        return None, None
+
+    if response.status_code in AUTH_FAILURE_STATUS_CODES:
+        raise AdoAuthenticationError(
+            f"Authentication with ADO failed (Status Code: {response.status_code}). "
+            "Check that your PAT is correct and has not expired."
+        )
+
+    if response.status_code == 200:
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+    return response.status_code, None
+
+def check_feature(session, org_url, api_version, pat, feature_id):
+    # Returns (is_valid, error); is_valid is None when ADO could not give a definite answer
+    url = (
+        f"{org_url}/_apis/wit/workitems?ids={quote(str(feature_id))}"
+        f"&fields=System.WorkItemType&errorPolicy=omit&api-version={api_version}"
+    )
+    status_code, data = get_json(session, url, pat)
+
+    if status_code == 200 and isinstance(data, dict):
+        work_item = (data.get("value") or [None])[0]
+        if not work_item:
+            return False, f"Parent Feature {feature_id} does not exist or you do not have access to it."
+        work_item_type = work_item.get("fields", {}).get("System.WorkItemType")
+        if work_item_type != "Feature":
+            return False, f"Work item {feature_id} is a {work_item_type}, not a Feature."
+        return True, None
+    if status_code == 200:
+        return None, f"Could not validate Parent Feature {feature_id} (ADO did not return JSON)."
+    if status_code in (400, 404):
+        return False, f"Parent Feature ID '{feature_id}' is not a valid work item ID."
+    return None, f"Could not validate Parent Feature {feature_id} (Status Code: {status_code})."
+
+def check_classification_path(session, org_url, project, api_version, pat, structure_group, path):
+    # Checks an iteration or area path such as "Design\\Accessibility", where the first segment is the project
+    segments = path.split("\\")
+    node_path = "/".join(quote(segment) for segment in segments[1:])
+    url = f"{org_url}/{quote(project)}/_apis/wit/classificationnodes/{structure_group}/{node_path}?api-version={api_version}"
+    status_code, data = get_json(session, url, pat)
+
+    label = "Iteration path" if structure_group == "Iterations" else "Area path"
+    if status_code == 200 and data is None:
+        return None, f"Could not validate {label.lower()} '{path}' (ADO did not return JSON)."
+    if status_code == 200 and segments[0] == project:
+        return True, None
+    if status_code in (200, 404):
+        return False, f"{label} '{path}' does not exist in the {project} project."
+    return None, f"Could not validate {label.lower()} '{path}' (Status Code: {status_code})."
+
+def check_work_item_fields(session, org_url, project, api_version, pat, work_item_type, field_names):
+    # Checks that every field we set when creating a PBI exists on the work item type
+    url = f"{org_url}/{quote(project)}/_apis/wit/workitemtypes/{quote(work_item_type)}/fields?api-version={api_version}"
+    status_code, data = get_json(session, url, pat)
+
+    if status_code == 200 and isinstance(data, dict):
+        available_fields = {field.get("referenceName") for field in data.get("value", [])}
+        missing_fields = [field for field in field_names if field not in available_fields]
+        if missing_fields:
+            return False, f"{work_item_type} is missing the field(s): {', '.join(missing_fields)}."
+        return True, None
+    if status_code == 200:
+        return None, f"Could not validate fields for {work_item_type} (ADO did not return JSON)."
+    if status_code == 404:
+        return False, f"Work item type '{work_item_type}' does not exist in the {project} project."
+    return None, f"Could not validate fields for {work_item_type} (Status Code: {status_code})."
+
+def validate_ado_targets(session, org_url, project, api_version, pat, feature_id, iteration_path, area_path, work_item_type, field_names):
+    # Validates the parent feature, iteration and area paths and work item type fields up front,
+    # so an invalid target fails once instead of on every row.
+    # Valid results are cached on disk so batch runs over many reports skip the checks entirely.
+    # Returns (errors, requests_made); an empty errors list means it is safe to create PBIs,
+    # and requests_made lets the caller count these lookups against the run's request budget.
+    cache = load_metadata_cache()
+    ttl_seconds = get_metadata_cache_ttl()
+    checks = [
+        (f"feature:{org_url}:{feature_id}",
+         lambda: check_feature(session, org_url, api_version, pat, feature_id)),
+        (f"iteration:{org_url}:{project}:{iteration_path}",
+         lambda: check_classification_path(session, org_url, project, api_version, pat, "Iterations", iteration_path)),
+        (f"area:{org_url}:{project}:{area_path}",
+         lambda: check_classification_path(session, org_url, project, api_version, pat, "Areas", area_path)),
+        (f"fields:{org_url}:{project}:{work_item_type}:{','.join(sorted(field_names))}",
+         lambda: check_work_item_fields(session, org_url, project, api_version, pat, work_item_type, field_names)),
+    ]
+
+    errors = []
+    requests_made = 0
+    cache_updated = False
+    for cache_key, check in checks:
+        if cache_key in cache:
+            continue
+
+        requests_made += 1
+        try:
+            is_valid, message = check()
+        except AdoAuthenticationError as e:
+            # A rejected PAT fails every check and every create, so stop at one clear error
+            return [str(e)], requests_made
+        if is_valid:
+            # Only valid results are cached, so a fixed report is re-checked on the next run
+            cache[cache_key] = {"expires_at": time.time() + ttl_seconds}
+            cache_updated = True
+        elif is_valid is False:
+            errors.append(message)
+        else:
+            # ADO was unreachable, returned a server error or an unexpected response; don't block the run on it
+            print(f"WARNING: {message}")
+
+    if cache_updated:
+        save_metadata_cache(cache)
+
+    return errors, requests_made
@@ -0,0 +1,67 @@
+import os
+import time
+
+# Each work item costs one request to create the PBI and one to link it to the parent feature
+REQUESTS_PER_WORK_ITEM = 2
+
+def get_run_budget(name, converter):
+    # Reads an optional budget setting, warning and falling back to no budget if the value is unusable
+    budget_text = os.getenv(name)
+    if not budget_text or not budget_text.strip():
+        return None
+    try:
+        budget = converter(budget_text.strip())
+    except ValueError:
+        print(f"WARNING: {name} '{budget_text}' is not a number, running without this budget.")
+        return None
+    if budget <= 0:
+        print(f"WARNING: {name} '{budget_text}' must be greater than zero, running without this budget.")
+        return None
+    return budget
+
+def schedule_work_items(work_items):
+    # Orders pending work items so the most important ones are filed first.
+    # Lower mapped priority (1 = High) comes first, then larger groups, then sheet order.
+    # sorted() is stable, so items that tie keep the order they appeared in the sheet.
+    return sorted(work_items, key=lambda item: (item["priority"], -len(item["rows"])))
+
+def submit_work_items(work_items, submit_fn, max_seconds=None, max_requests=None):
+    # Submits work items in the given order until they are all done or the run budget is spent.
+    # max_seconds is a wall-clock budget and max_requests is an ADO request budget; None means unlimited.
+    # A work item is only started if it can finish within the request budget, so we never stop halfway
+    # between creating a PBI and linking it.
+    # Returns (completed, remaining) where completed is a list of (work_item, pbi_url) pairs.
+    start_time = time.monotonic()
+    requests_used = 0
+    completed = []
+
+    for position, work_item in enumerate(work_items):
+        if max_seconds is not None and time.monotonic() - start_time >= max_seconds:
+            print(f"\nBUDGET: Time budget of {max_seconds} second(s) reached, stopping submission.")
+            return completed, work_items[position:]
+
+        if max_requests is not None and requests_used + REQUESTS_PER_WORK_ITEM > max_requests:
+            print(f"\nBUDGET: Request budget of {max_requests} request(s) reached, stopping submission.")
+            return completed, work_items[position:]
+
+        pbi_url = submit_fn(work_item)
+        # A failed create is a single request, since the link call is never made
+        requests_used += REQUESTS_PER_WORK_ITEM if pbi_url else 1
+        completed.append((work_item, pbi_url))
+
+    return completed, []
+
+def print_remaining_report(remaining):
+    # Prints the work items that were not submitted before the budget ran out.
+    # These rows keep an empty 'Remediation PBI' cell, so the next run picks them up automatically.
+    if not remaining:
+        return
+
+    print(f"\nREMAINING: {len(remaining)} work item(s) were not submitted:")
+    for work_item in remaining:
+        rows = ", ".join(str(row) for row in work_item["rows"])
+        if work_item["group"] is not None:
+            print(f"  - Priority {work_item['priority']}, group {work_item['group']}, row(s) {rows}")
+        else:
+            print(f"  - Priority {work_item['priority']}, row {rows}")
+    print("Run the script again on the same file to submit the remaining work items.\n")
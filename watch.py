@@ -0,0 +1,113 @@
+import os
+import time
+
+# inotify is optional; without it (or on non-Linux systems) we fall back to polling the directory
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+def is_workbook(filename):
+    # Only pick up Excel workbooks, ignoring the "~$" lock files Excel writes next to open files
+    return filename.lower().endswith(".xlsx") and not filename.startswith("~$")
+
+def file_signature(path):
+    # A file's modification time and size, used to tell when it has changed or is still being written
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def scan_workbooks(directory):
+    # Returns the signature of every workbook currently in the directory
+    signatures = {}
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if is_workbook(filename) and os.path.isfile(path):
+            signatures[path] = file_signature(path)
+    return signatures
+
+def watch_directory(directory, process_fn, debounce_seconds=5, poll_interval=2, retry_seconds=300):
+    # Watches a directory and calls process_fn(path) for each new or modified workbook.
+    # A workbook is only processed once its signature has stayed the same for debounce_seconds,
+    # so files that are still being copied or saved are not picked up half-written.
+    # If process_fn returns True (work was left unfiled), the workbook is processed again after retry_seconds.
+    # Runs until interrupted with Ctrl+C.
+
+    # Workbooks already in the folder are treated as handled; only new or modified ones are processed
+    processed = scan_workbooks(directory)
+
+    # Workbooks waiting to settle: path -> (signature, time that signature was first seen)
+    pending = {}
+
+    # Workbooks with unfiled work items: path -> time to process them again
+    retry_at = {}
+
+    inotify = None
+    if INotify is not None:
+        try:
+            inotify = INotify()
+            inotify.add_watch(directory, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO)
+            print(f"Watching {directory} for new or modified workbooks (inotify)...")
+        except OSError as e:
+            print(f"WARNING: inotify is unavailable ({str(e)}), falling back to polling.")
+            inotify = None
+    if inotify is None:
+        print(f"Watching {directory} for new or modified workbooks (polling every {poll_interval} second(s))...")
+
+    print("Press Ctrl+C to stop.\n")
+
+    try:
+        while True:
+            if inotify is not None:
+                # Block until something changes, waking up regularly to check pending files
+                candidates = set(pending)
+                for event in inotify.read(timeout=int(poll_interval * 1000)):
+                    if is_workbook(event.name):
+                        candidates.add(os.path.join(directory, event.name))
+            else:
+                time.sleep(poll_interval)
+                candidates = set(scan_workbooks(directory)) | set(pending)
+
+            now = time.monotonic()
+
+            # Forget workbooks that are due a retry so they are picked up like a modified file
+            for path, due in list(retry_at.items()):
+                if now >= due:
+                    del retry_at[path]
+                    processed.pop(path, None)
+                    candidates.add(path)
+
+            for path in candidates:
+                signature = file_signature(path)
+
+                # Deleted, or unchanged since we last processed it (including our own save)
+                if signature is None or signature == processed.get(path):
+                    pending.pop(path, None)
+                    continue
+
+                # New or still changing, so restart the debounce timer
+                if path not in pending or pending[path][0] != signature:
+                    pending[path] = (signature, now)
+                    continue
+
+                if now - pending[path][1] < debounce_seconds:
+                    continue
+
+                del pending[path]
+                retry_at.pop(path, None)
+                print(f"\nPROCESSING: {path}\n")
+                work_remaining = process_fn(path)
+
+                # Record the signature after processing, since writing PBI URLs back modifies the file
+                processed[path] = file_signature(path)
+
+                if work_remaining:
+                    retry_at[path] = time.monotonic() + retry_seconds
+                    print(f"RETRY: {path} still has unfiled work items, trying again in {retry_seconds} second(s).\n")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        if inotify is not None:
+            inotify.close()